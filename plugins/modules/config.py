@@ -9,8 +9,12 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+import functools
+import mmap
 import os
+import re
 import shlex
+import sys
 import tempfile
 from ansible.module_utils.basic import AnsibleModule
 
@@ -79,9 +83,172 @@ diff:
   type: list
 """
 
+# Characters that require full shell-like tokenization. Lines without them
+# (the vast majority of sshd_config) are split with str.split().
+_QUOTE_CHARS = frozenset('"\'\\')
+
+
+# Temporary files are written through a large buffer to batch write() syscalls
+_WRITE_BUFFER_SIZE = 1 << 20
+
+
+# Single-pass classification of a plain "Keyword value..." line
+_LINE_RE = re.compile(r'^(?P<indent>[ \t]*)(?P<kw>[A-Za-z][A-Za-z0-9_-]*)[ \t]+(?P<rest>.*?)\s*$')
+
+
+# Leading indentation of a line
+_INDENT_RE = re.compile(r'^[ \t]*')
+
+# Known sshd_config keywords (lower-case). Keys of parsed lines are mapped to
+# these shared instances, so repeated keywords do not allocate new strings and
+# dict lookups on (scope, key) pairs compare by identity.
+_SSHD_KEYWORDS = frozenset(sys.intern(k) for k in (
+    'acceptenv', 'addressfamily', 'allowagentforwarding', 'allowgroups',
+    'allowstreamlocalforwarding', 'allowtcpforwarding', 'allowusers',
+    'authenticationmethods', 'authorizedkeyscommand', 'authorizedkeyscommanduser',
+    'authorizedkeysfile', 'authorizedprincipalscommand',
+    'authorizedprincipalscommanduser', 'authorizedprincipalsfile', 'banner',
+    'casignaturealgorithms', 'challengeresponseauthentication', 'channeltimeout',
+    'chrootdirectory', 'ciphers', 'clientalivecountmax', 'clientaliveinterval',
+    'compression', 'denygroups', 'denyusers', 'disableforwarding',
+    'exposeauthinfo', 'fingerprinthash', 'forcecommand', 'gatewayports',
+    'gssapiauthentication', 'gssapicleanupcredentials', 'gssapikeyexchange',
+    'gssapistrictacceptorcheck', 'hostbasedacceptedalgorithms',
+    'hostbasedauthentication', 'hostbasedusesnamefrompacketonly',
+    'hostcertificate', 'hostkey', 'hostkeyagent', 'hostkeyalgorithms',
+    'ignorerhosts', 'ignoreuserknownhosts', 'include', 'ipqos',
+    'kbdinteractiveauthentication', 'kerberosauthentication',
+    'kerberosgetafstoken', 'kerberosorlocalpasswd', 'kerberosticketcleanup',
+    'kexalgorithms', 'listenaddress', 'logingracetime', 'loglevel', 'logverbose',
+    'macs', 'match', 'maxauthtries', 'maxsessions', 'maxstartups', 'modulifile',
+    'passwordauthentication', 'permitemptypasswords', 'permitlisten',
+    'permitopen', 'permitrootlogin', 'permittty', 'permittunnel',
+    'permituserenvironment', 'permituserrc', 'persourcemaxstartups',
+    'persourcenetblocksize', 'persourcepenalties', 'persourcepenaltyexemptlist',
+    'pidfile', 'port', 'printlastlog', 'printmotd', 'pubkeyacceptedalgorithms',
+    'pubkeyauthentication', 'pubkeyauthoptions', 'rdomain', 'rekeylimit',
+    'requiredrsasize', 'revokedkeys', 'securitykeyprovider', 'setenv',
+    'streamlocalbindmask', 'streamlocalbindunlink', 'strictmodes', 'subsystem',
+    'syslogfacility', 'tcpkeepalive', 'trustedusercakeys',
+    'unusedconnectiontimeout', 'usedns', 'usepam', 'versionaddendum',
+    'x11displayoffset', 'x11forwarding', 'x11uselocalhost', 'xauthlocation',
+))
+_CANON = {k: k for k in _SSHD_KEYWORDS}
+
+
+def _canonical_key(token):
+    """Lower-cases a keyword and returns the shared instance for known sshd keywords."""
+    lowered = token.lower()
+    return _CANON.get(lowered, lowered)
+
+
+def _split_tokens(stripped):
+    """
+    Tokenizes a stripped configuration line.
+    Uses plain whitespace splitting when the line holds no quoting characters,
+    falls back to shlex otherwise. Raises ValueError on malformed quoting.
+    """
+    if _QUOTE_CHARS.isdisjoint(stripped):
+        return stripped.split()
+    return shlex.split(stripped)
+
+
+@functools.lru_cache(maxsize=64)
+def _stat(path):
+    """
+    Memoized os.stat for the paths touched during one module run.
+    Returns None for missing paths. Cleared whenever the module writes to disk.
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+# A lone carriage return ends a line for text-mode reads but not for b'\n' counting
+_LONE_CR_RE = re.compile(rb'\r(?!\n)')
+
+
+def _iter_candidate_lines(filepath, keys):
+    """
+    Yields (line index, line) for Match headers and lines starting with one of the keys.
+    An mmap of the file is scanned with a single compiled pattern, so all other lines
+    are skipped in C without being decoded or split.
+    Files with lone carriage returns are read in text mode and yielded in full.
+    """
+    pattern = re.compile(
+        rb'^[ \t]*(?:match|' + b'|'.join(re.escape(k.encode('utf-8')) for k in keys) + rb')(?=[ \t\r\n]|$)',
+        re.IGNORECASE | re.MULTILINE)
+
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if _LONE_CR_RE.search(mm) is None:
+                index = pos = 0
+                for m in pattern.finditer(mm):
+                    start = m.start()
+                    index += mm[pos:start].count(b'\n')
+                    pos = start
+                    end = mm.find(b'\n', start)
+                    yield index, mm[start:len(mm) if end < 0 else end + 1].decode('utf-8')
+                return
+
+    # Line numbering would disagree with the text-mode rewrite; scan every line
+    with open(filepath, 'r', encoding='utf-8') as f:
+        yield from enumerate(f)
+
+
+def _is_keyword(token, keyword):
+    """
+    Case-insensitive comparison of a token with a lower-case keyword.
+    The length check rejects most tokens without allocating a lowered copy.
+    """
+    return len(token) == len(keyword) and token.lower() == keyword
+
+
+def _iter_scoped_lines(numbered_lines):
+    """
+    Single scope-aware pass over (line index, line) pairs.
+    Yields (index, kind, scope, indent, key_lower, value, raw) tuples, where kind is
+    'match', 'include', 'option' or 'ignored' (comments, blank and malformed lines).
+    A Match line carries the scope it opens and its normalized condition as value.
+    """
+    scope = "global"
+    for i, raw in numbered_lines:
+        # Fast path: plain keyword line without quoting
+        m = _LINE_RE.match(raw)
+        if m is not None and _QUOTE_CHARS.isdisjoint(m.group('rest')):
+            indent = m.group('indent')
+            keyword = m.group('kw')
+            args = m.group('rest').split()
+        else:
+            stripped = raw.strip()
+            if not stripped or stripped[0] == '#':
+                yield i, 'ignored', scope, None, None, None, raw
+                continue
+            try:
+                parts = _split_tokens(stripped)
+            except ValueError:
+                yield i, 'ignored', scope, None, None, None, raw
+                continue
+            indent = _INDENT_RE.match(raw).group(0)
+            keyword = parts[0]
+            args = parts[1:]
+
+        value = " ".join(args)
+        if _is_keyword(keyword, 'match'):
+            scope = "global" if not value or value.lower() == "all" else value
+            yield i, 'match', scope, indent, 'match', value, raw
+        elif _is_keyword(keyword, 'include'):
+            yield i, 'include', scope, indent, 'include', value, raw
+        else:
+            yield i, 'option', scope, indent, _canonical_key(keyword), value, raw
+
 class SshLine:
     """
-    Base class and factory for SSH configuration lines.
+    Base class for editable SSH configuration lines.
+    Lines are classified by _iter_scoped_lines; objects are built only for lines being edited.
     """
     def __init__(self, raw_content):
         self.raw = raw_content
@@ -95,87 +262,28 @@ class SshLine:
     def diff(self):
         return self._diff_info
 
-    @classmethod
-    def create(cls, raw_line):
-        """
-        Factory method. Analyzes the line and returns an instance of the appropriate subclass.
-        """
-        stripped = raw_line.strip()
-
-        # 1. Quick check for non-parseable content (comments, blank lines)
-        if not stripped or stripped.startswith('#'):
-            return IgnoredLine(raw_line)
-
-        # 2. Attempt to parse structure to determine line type
-        try:
-            parts = shlex.split(stripped)
-        except ValueError:
-            # If quotes are unclosed or input is malformed
-            # treat as Ignored, do not break execution
-            return IgnoredLine(raw_line)
-
-        if not parts:
-            return IgnoredLine(raw_line)
-
-        first_token = parts[0].lower()
-
-        # 3. Route by line type
-        if first_token == 'match':
-            # Pass parts so MatchLine does not parse again
-            return MatchLine(raw_line, parts=parts)
-
-        if first_token == 'include':
-            return IgnoredLine(raw_line)
-
-        # 4. All other cases are treated as configuration options
-        return ConfigLine(raw_line, parts=parts)
-
-class IgnoredLine(SshLine):
-    """Lines that are not modified (comments, blank lines, includes, parse errors)."""
-    pass
-
-class MatchLine(SshLine):
-    """Match directive. Defines a scope context."""
-
-    def __init__(self, raw_content, parts=None):
-        super().__init__(raw_content)
-
-        # If parts are provided (from Factory) — use them.
-        # If not provided (manual object creation in tests) — parse ourselves.
-        if parts is None:
-            try:
-                parts = shlex.split(raw_content.strip())
-            except ValueError:
-                parts = []
-
-        # Now parts are guaranteed to exist, compute scope
-        if parts and len(parts) > 1:
-            val = " ".join(parts[1:])
-            self.scope = "global" if val.lower() == "all" else val
-        else:
-            # Fallback for malformed lines
-            self.scope = "global"
-
 class ConfigLine(SshLine):
     """Configuration option (Key Value pair)."""
-    def __init__(self, raw_content, parts=None):
+    def __init__(self, raw_content, parts=None, indent=None):
         super().__init__(raw_content)
 
         # 1. Compute indentation (fast operation, no shlex needed)
-        self.indent = raw_content[:len(raw_content) - len(raw_content.lstrip())]
+        if indent is None:
+            indent = _INDENT_RE.match(raw_content).group(0)
+        self.indent = indent
 
         # 2. Extract tokens
         if parts is None:
             stripped = raw_content.strip()
             try:
-                parts = shlex.split(stripped)
+                parts = _split_tokens(stripped)
             except ValueError:
                 parts = []
 
         # 3. Populate fields
         if parts:
             self.key = parts[0]
-            self.key_lower = self.key.lower()
+            self.key_lower = _canonical_key(self.key)
             self.value = " ".join(parts[1:])
         else:
             # Fallback for empty ConfigLine creation (unlikely, but for safety)
@@ -210,52 +318,79 @@ class FileManipulator:
         self.diffs = []
 
     def process_file(self, filepath, target_scope, target_key, target_value=None, state="present"):
-        if not os.path.exists(filepath):
-            return False
+        found = self.process_file_batch(filepath, [(target_scope, target_key, target_value, state)])
+        return bool(found)
 
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                raw_lines = f.readlines()
-        except IOError:
-            return False
+    def process_file_batch(self, filepath, edits):
+        """
+        Applies several option edits to one file in a single pass.
+        Each edit is a (scope, key, value, state) tuple; value is ignored for 'absent'.
+        Returns the set of (scope, key_lower) pairs found with state 'present'.
+        """
+        found = set()
+        if _stat(filepath) is None:
+            return found
 
-        # Use the factory method from the class
-        line_objects = [SshLine.create(line) for line in raw_lines]
+        # (scope, key_lower) -> (value, state) for O(1) lookup per option line
+        wanted = {
+            (scope, _canonical_key(key)): (value, state)
+            for scope, key, value, state in edits
+        }
 
-        current_scope = "global"
-        target_key_lower = target_key.lower()
-        found_in_scope = False
-        file_modified = False
+        if not wanted:
+            return found
 
-        for i, obj in enumerate(line_objects):
+        # Sparse record of changed lines: line index -> new text
+        line_edits = {}
 
-            # Polymorphism: check object type
-            if isinstance(obj, MatchLine):
-                current_scope = obj.scope
-                continue
+        try:
+            # Only Match headers and lines starting with a target key are visited
+            candidates = _iter_candidate_lines(filepath, {key for _, key in wanted})
+            for i, kind, scope, indent, key_lower, _, line in _iter_scoped_lines(candidates):
+                if kind != 'option':
+                    continue
+
+                target = (scope, key_lower)
+                edit = wanted.get(target)
+                if edit is None:
+                    continue
+
+                obj = ConfigLine(line, indent=indent)
+
+                # Business logic
+                target_value, state = edit
+                if state == "absent":
+                    obj.comment_out()
+                elif state == "present":
+                    found.add(target)
+                    obj.update(target_value)
+
+                if obj.modified:
+                    line_edits[i] = obj.render()
+                    if obj.diff:
+                        # Add context (file/line number)
+                        diff_entry = obj.diff.copy()
+                        diff_entry.update({'file': filepath, 'line': i + 1})
+                        self.diffs.append(diff_entry)
+        except UnicodeDecodeError as e:
+            self.module.fail_json(msg=f"Failed to read {filepath} as UTF-8: {e}")
+        except IOError:
+            return found
+
+        if line_edits:
+            self._write_atomic(filepath, edits=line_edits)
+
+        return found
 
-            if isinstance(obj, ConfigLine):
-                if current_scope == target_scope and obj.key_lower == target_key_lower:
-                    # Business logic
-                    if state == "absent":
-                        obj.comment_out()
-                    elif state == "present":
-                        found_in_scope = True
-                        obj.update(target_value)
-
-                    if obj.modified:
-                        file_modified = True
-                        if obj.diff:
-                            # Add context (file/line number)
-                            diff_entry = obj.diff.copy()
-                            diff_entry.update({'file': filepath, 'line': i + 1})
-                            self.diffs.append(diff_entry)
-
-        if file_modified:
-            new_content = [obj.render() for obj in line_objects]
-            self._write_atomic(filepath, new_content)
-
-        return found_in_scope
+    @staticmethod
+    def _iter_edited(filepath, edits):
+        """
+        Re-reads the original file, yielding its lines with edited ones substituted.
+        Keeps memory proportional to the number of edits rather than the file size.
+        """
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                yield edits.get(i, line)
 
     def insert_new_option(self, filepath, condition, key, value):
         """
@@ -263,76 +398,112 @@ class FileManipulator:
         Global -> inserts before the first Match directive or at the end.
         Match -> locates the block and inserts inside, or creates a new block.
         """
-        if not os.path.exists(filepath):
-            # If file does not exist (e.g., new include), create it
-            lines = []
-        else:
+        new_line = f"{key} {value}\n"
+        # If file does not exist (e.g., new include), it is created from scratch
+        index, text, action = self._plan_insertion((), condition, new_line)
+        if _stat(filepath) is not None:
             try:
                 with open(filepath, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
+                    index, text, action = self._plan_insertion(f, condition, new_line)
+            except UnicodeDecodeError as e:
+                self.module.fail_json(msg=f"Failed to read {filepath} as UTF-8: {e}")
             except IOError:
                 self.module.fail_json(msg=f"Cannot read file for insertion: {filepath}")
 
-        new_line = f"{key} {value}\n"
+        self._write_atomic(filepath, self._iter_inserted(filepath, index, text))
+
+        self.diffs.append({'file': filepath, 'action': action, 'val': value})
+
+    @staticmethod
+    def _plan_insertion(lines, condition, new_line):
+        """
+        Decides where new_line goes in a single pass over lines.
+        Returns (index, text, action): text is inserted before line index, or appended
+        when index is None. Action is 'insert_global', 'insert_match' or 'new_block'.
+        """
+        last = ""
+
+        for i, kind, _, _, _, block_scope, line in _iter_scoped_lines(enumerate(lines)):
+            if kind == 'match':
+                if condition == "global":
+                    # Insert before the first Match to avoid inserting inside a block
+                    return i, new_line, 'insert_global'
+                if block_scope == condition:
+                    # Block found! Insert immediately after header with indentation
+                    return i + 1, f"    {new_line}", 'insert_match'
+            last = line
 
         if condition == "global":
-            # Determine insertion point (before first Match to avoid inserting inside a block)
-            insert_idx = len(lines)
-            for i, line in enumerate(lines):
-                if line.strip().lower().startswith('match '):
-                    insert_idx = i
-                    break
-            lines.insert(insert_idx, new_line)
-            self.diffs.append({'file': filepath, 'action': 'insert_global', 'val': value})
-        else:
-            # Search for Match block header
-            match_found = False
-            for i, line in enumerate(lines):
-                stripped = line.strip().lower()
-                # Simplified header check
-                if stripped.startswith('match '):
-                    # Parse precisely to verify condition
-                    try:
-                        parts = shlex.split(line.strip())
-                        block_scope = " ".join(parts[1:])
-                    except ValueError:
-                        continue
-
-                    if block_scope == condition:
-                        # Block found! Insert immediately after header with indentation
-                        lines.insert(i + 1, f"    {new_line}")
-                        match_found = True
-                        self.diffs.append({'file': filepath, 'action': 'insert_match', 'val': value})
-                        break
-
-            if not match_found:
-                # Block does not exist -> create new block at end of file
-                prefix = "\n" if lines and lines[-1].strip() else ""
-                lines.append(f"{prefix}Match {condition}\n    {new_line}")
-                self.diffs.append({'file': filepath, 'action': 'new_block', 'val': value})
-
-        self._write_atomic(filepath, lines)
-
-    def _write_atomic(self, filepath, lines):
+            return None, new_line, 'insert_global'
+
+        # Block does not exist -> create new block at end of file
+        prefix = "\n" if last.strip() else ""
+        return None, f"{prefix}Match {condition}\n    {new_line}", 'new_block'
+
+    @staticmethod
+    def _iter_inserted(filepath, index, text):
+        """
+        Streams the file with text inserted before line index.
+        Text is appended when index is None or past the last line.
+        """
+        pending = True
+        if _stat(filepath) is not None:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                for i, line in enumerate(f):
+                    if i == index:
+                        yield text
+                        pending = False
+                    yield line
+        if pending:
+            yield text
+
+    def _write_atomic(self, filepath, lines=None, edits=None):
+        """
+        Replaces filepath with the given lines, or, when sparse edits
+        (line index -> new text) are given, with a copy of the original file
+        where those lines are substituted.
+        """
+        if edits is not None:
+            lines = self._iter_edited(filepath, edits)
+
         if self.module.params['backup']:
             self.module.backup_local(filepath)
 
         dir_path = os.path.dirname(filepath)
         # If creating a new file in conf.d/
-        if not os.path.exists(dir_path):
+        if _stat(dir_path) is None:
             try:
                 os.makedirs(dir_path)
             except OSError as e:
                 self.module.fail_json(msg=f"Failed to create directory {dir_path}: {e}")
+            finally:
+                _stat.cache_clear()
 
         tmp_fd, tmp_path = tempfile.mkstemp(dir=dir_path, text=True)
         try:
-            with os.fdopen(tmp_fd, 'w') as f:
+            with os.fdopen(tmp_fd, 'w', buffering=_WRITE_BUFFER_SIZE) as f:
                 f.writelines(lines)
             self.module.atomic_move(tmp_path, filepath)
+        except UnicodeDecodeError as e:
+            # Source lines are read lazily while the temporary file is written
+            self._discard(tmp_path)
+            self.module.fail_json(msg=f"Failed to read {filepath} as UTF-8: {e}")
         except (IOError, OSError) as e:
-            os.remove(tmp_path)
+            self._discard(tmp_path)
             self.module.fail_json(msg=f"Failed to write config: {e}")
+        except BaseException:
+            self._discard(tmp_path)
+            raise
+        finally:
+            _stat.cache_clear()
+
+    @staticmethod
+    def _discard(tmp_path):
+        """Removes a leftover temporary file, if it still exists."""
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
 
 def main():
     module = AnsibleModule(
@@ -360,13 +531,15 @@ def main():
     if state == "present" and value is None:
         module.fail_json(msg="parameter \"value\" is required when state is \"present\"")
 
-    if not os.path.exists(config_path) and state == "absent":
+    config_exists = _stat(config_path) is not None
+
+    if not config_exists and state == "absent":
         # If config does not exist and we want to remove - already satisfied, no action needed
         module.exit_json(changed=False)
 
     parser = SshConfigParser(base_dir=base_dir)
     # If file exists, parse it. If not (creating from scratch), parser will skip.
-    if os.path.exists(config_path):
+    if config_exists:
         parser.parse(config_path, "global")
 
     full_data = parser.get_structured_data()
@@ -390,29 +563,38 @@ def main():
                 option_location = opts[key].get('location')
                 option_appearance = opts[key].get('appearance', [])
 
+    # The parser may report a file more than once; visit each file once, in order
+    option_appearance = list(dict.fromkeys(option_appearance))
+
     manipulator = FileManipulator(module)
 
+    # Edits grouped per file, so each file is read and rewritten at most once
+    file_edits = {}
+
     if state == "absent":
         if option_appearance:
             # Remove from all locations where found
             for fpath in option_appearance:
-                manipulator.process_file(fpath, condition, key, state="absent")
+                file_edits.setdefault(fpath, []).append((condition, key, None, "absent"))
 
     elif state == "present":
         if option_location:
             # Scenario A: Option ALREADY exists.
             # 1. Update the "winner" (effective location)
-            manipulator.process_file(option_location, condition, key, target_value=value, state="present")
+            file_edits.setdefault(option_location, []).append((condition, key, value, "present"))
 
-            # 2. Remove the "losers" (shadowed duplicates)
-            for fpath in option_appearance:
-                if fpath != option_location:
-                    manipulator.process_file(fpath, condition, key, state="absent")
+            # 2. Remove the "losers" (shadowed duplicates), if there are any
+            losers = [fpath for fpath in option_appearance if fpath != option_location]
+            for fpath in losers:
+                file_edits.setdefault(fpath, []).append((condition, key, None, "absent"))
         else:
             # Scenario B: Option does NOT exist.
             # Insert into the main file (or user-specified file)
             manipulator.insert_new_option(config_path, condition, key, value)
 
+    for fpath, edits in file_edits.items():
+        manipulator.process_file_batch(fpath, edits)
+
     module.exit_json(changed=bool(manipulator.diffs), diff=manipulator.diffs)
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Alexander Ursu <alexander.ursu@gmail.com>
+# SPDX-License-Identifier: MIT
+
+import importlib.util
+import os
+
+import pytest
+
+MODULE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'plugins', 'modules', 'config.py')
+
+spec = importlib.util.spec_from_file_location('ssh_setup_config', MODULE_PATH)
+config = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config)
+
+
+class FailJson(Exception):
+    pass
+
+
+class FakeModule:
+    """Minimal stand-in for AnsibleModule as used by FileManipulator."""
+    def __init__(self):
+        self.params = {'backup': False}
+
+    def fail_json(self, **kwargs):
+        raise FailJson(kwargs)
+
+    def atomic_move(self, src, dest):
+        os.rename(src, dest)
+
+
+def run(tmp_path, content, scope, key, value=None, state="present"):
+    filepath = tmp_path / 'sshd_config'
+    filepath.write_bytes(content)
+    manipulator = config.FileManipulator(FakeModule())
+    found = manipulator.process_file(str(filepath), scope, key, value, state)
+    diffs = [(d['action'], d['line']) for d in manipulator.diffs]
+    return found, diffs, filepath.read_bytes()
+
+
+def test_lf_update_and_remove(tmp_path):
+    content = b"# header\nPort 22\nMatch User bob\n  Port 2022\n"
+
+    found, diffs, result = run(tmp_path, content, 'global', 'port', '2222')
+    assert found
+    assert diffs == [('update', 2)]
+    assert result == b"# header\nPort 2222\nMatch User bob\n  Port 2022\n"
+
+    found, diffs, result = run(tmp_path, content, 'User bob', 'Port', state='absent')
+    assert not found
+    assert diffs == [('remove', 4)]
+    assert result == b"# header\nPort 22\nMatch User bob\n#   Port 2022 # Removed by Ansible\n"
+
+
+def test_unchanged_value_is_not_rewritten(tmp_path):
+    found, diffs, result = run(tmp_path, b"Port 22\n", 'global', 'Port', '22')
+    assert found
+    assert diffs == []
+    assert result == b"Port 22\n"
+
+
+def test_crlf(tmp_path):
+    content = b"Port 22\r\nMatch User bob\r\n  Port 2\r\n"
+    found, diffs, result = run(tmp_path, content, 'User bob', 'Port', '3')
+    assert found
+    assert diffs == [('update', 3)]
+    assert result == b"Port 22\nMatch User bob\n  Port 3\n"
+
+
+def test_lone_cr(tmp_path):
+    content = b"# c\rPort 22\rUsePAM yes\r"
+    found, diffs, result = run(tmp_path, content, 'global', 'UsePAM', state='absent')
+    assert not found
+    assert diffs == [('remove', 3)]
+    assert result == b"# c\nPort 22\n# UsePAM yes # Removed by Ansible\n"
+
+
+def test_empty_file(tmp_path):
+    found, diffs, result = run(tmp_path, b"", 'global', 'Port', '22')
+    assert not found
+    assert diffs == []
+    assert result == b""
+
+
+def test_missing_trailing_newline(tmp_path):
+    found, diffs, result = run(tmp_path, b"UsePAM yes\nPort 22", 'global', 'Port', '2222')
+    assert found
+    assert diffs == [('update', 2)]
+    assert result == b"UsePAM yes\nPort 2222\n"
+
+
+def test_key_prefix_and_comments_are_skipped(tmp_path):
+    content = b"PortX 1\n#Port 2\nPortable yes\nPort 3\n"
+    found, diffs, result = run(tmp_path, content, 'global', 'Port', '4')
+    assert found
+    assert diffs == [('update', 4)]
+    assert result == b"PortX 1\n#Port 2\nPortable yes\nPort 4\n"
+
+
+def test_quoted_lines(tmp_path):
+    content = b'Banner "/etc/issue net"\nBanner \'x\nMatch User "bob"\n  Banner none\n'
+
+    found, diffs, result = run(tmp_path, content, 'global', 'Banner', '/etc/issue')
+    assert found
+    assert diffs == [('update', 1)]
+    assert result == b'Banner /etc/issue\nBanner \'x\nMatch User "bob"\n  Banner none\n'
+
+    found, diffs, result = run(tmp_path, content, 'User bob', 'Banner', '/etc/bob')
+    assert found
+    assert diffs == [('update', 4)]
+    assert result == b'Banner "/etc/issue net"\nBanner \'x\nMatch User "bob"\n  Banner /etc/bob\n'
+
+
+def test_malformed_match_header_keeps_scope(tmp_path):
+    content = b"Port 22\nMatch User bob\nPort 1\nMatch User \"bob\nPort 2\n"
+
+    found, diffs, result = run(tmp_path, content, 'User bob', 'Port', state='absent')
+    assert not found
+    assert diffs == [('remove', 3), ('remove', 5)]
+    assert result == (
+        b"Port 22\nMatch User bob\n# Port 1 # Removed by Ansible\n"
+        b"Match User \"bob\n# Port 2 # Removed by Ansible\n"
+    )
+
+    found, diffs, result = run(tmp_path, content, 'global', 'Port', '2222')
+    assert found
+    assert diffs == [('update', 1)]
+
+
+def test_invalid_utf8_outside_target_line(tmp_path):
+    content = b"Port 22\n# caf\xe9\n"
+    with pytest.raises(FailJson):
+        run(tmp_path, content, 'global', 'Port', '2222')
+    assert os.listdir(str(tmp_path)) == ['sshd_config']
+    assert (tmp_path / 'sshd_config').read_bytes() == content
+
+
+@pytest.mark.parametrize('content', [
+    b"Port 22\nPort caf\xe9\n",
+    b"Port 22\nMatch User caf\xe9\n  Port 1\n",
+    b"Port 22\rPort caf\xe9\r",
+])
+def test_invalid_utf8_candidate_line(tmp_path, content):
+    with pytest.raises(FailJson, match='UTF-8'):
+        run(tmp_path, content, 'global', 'Port', '2222')
+    assert os.listdir(str(tmp_path)) == ['sshd_config']
+    assert (tmp_path / 'sshd_config').read_bytes() == content
+
+
+def insert(filepath, condition, key, value):
+    manipulator = config.FileManipulator(FakeModule())
+    manipulator.insert_new_option(str(filepath), condition, key, value)
+    return [d['action'] for d in manipulator.diffs], filepath.read_bytes()
+
+
+def test_insert_global_before_first_match(tmp_path):
+    filepath = tmp_path / 'sshd_config'
+    filepath.write_bytes(b"Port 22\nMatch User bob\n  Port 2022\nMatch all\n")
+    actions, result = insert(filepath, 'global', 'UsePAM', 'yes')
+    assert actions == ['insert_global']
+    assert result == b"Port 22\nUsePAM yes\nMatch User bob\n  Port 2022\nMatch all\n"
+
+
+def test_insert_global_without_match_appends(tmp_path):
+    filepath = tmp_path / 'sshd_config'
+    filepath.write_bytes(b"Port 22\n")
+    actions, result = insert(filepath, 'global', 'UsePAM', 'yes')
+    assert actions == ['insert_global']
+    assert result == b"Port 22\nUsePAM yes\n"
+
+
+@pytest.mark.parametrize('header', [b"Match User bob", b"Match\tUser bob", b"  match  User  bob "])
+def test_insert_match_into_existing_block(tmp_path, header):
+    filepath = tmp_path / 'sshd_config'
+    filepath.write_bytes(b"Port 22\nMatch Group g\n  X 1\n" + header + b"\n  Port 2022\n")
+    actions, result = insert(filepath, 'User bob', 'UsePAM', 'no')
+    assert actions == ['insert_match']
+    assert result == b"Port 22\nMatch Group g\n  X 1\n" + header + b"\n    UsePAM no\n  Port 2022\n"
+
+
+def test_insert_match_after_last_line_header(tmp_path):
+    filepath = tmp_path / 'sshd_config'
+    filepath.write_bytes(b"Port 22\nMatch User bob\n")
+    actions, result = insert(filepath, 'User bob', 'UsePAM', 'no')
+    assert actions == ['insert_match']
+    assert result == b"Port 22\nMatch User bob\n    UsePAM no\n"
+
+
+@pytest.mark.parametrize('content, expected', [
+    (b"Port 22\n", b"Port 22\n\nMatch User bob\n    UsePAM no\n"),
+    (b"Port 22", b"Port 22\nMatch User bob\n    UsePAM no\n"),
+    (b"Port 22\n\n", b"Port 22\n\nMatch User bob\n    UsePAM no\n"),
+])
+def test_new_block(tmp_path, content, expected):
+    filepath = tmp_path / 'sshd_config'
+    filepath.write_bytes(content)
+    actions, result = insert(filepath, 'User bob', 'UsePAM', 'no')
+    assert actions == ['new_block']
+    assert result == expected
+
+
+def test_missing_file_in_missing_directory(tmp_path):
+    filepath = tmp_path / 'sshd_config.d' / '50-ansible.conf'
+    actions, result = insert(filepath, 'User bob', 'UsePAM', 'no')
+    assert actions == ['new_block']
+    assert result == b"Match User bob\n    UsePAM no\n"
+
+
+def test_insert_invalid_utf8_leaves_no_temp_file(tmp_path):
+    filepath = tmp_path / 'sshd_config'
+    filepath.write_bytes(b"Port 22\nBanner \xff\nMatch User bob\n")
+    with pytest.raises(FailJson, match='UTF-8'):
+        insert(filepath, 'global', 'UsePAM', 'yes')
+    assert os.listdir(tmp_path) == ['sshd_config']
+    assert filepath.read_bytes() == b"Port 22\nBanner \xff\nMatch User bob\n"